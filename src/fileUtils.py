@@ -1,13 +1,17 @@
 import os
 import re
 
+_INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*]')
+
 
 def sanitize_filename(filename):
     """Removes invalid characters from a string to make it a valid filename."""
-    return re.sub(r'[<>:"/\\|?*]', "-", filename).strip()
+    return _INVALID_FILENAME_CHARS.sub("-", filename).strip()
 
 
 def delete_file(file_path):
     """Deletes a file if it exists."""
-    if os.path.exists(file_path):
+    try:
         os.remove(file_path)
+    except FileNotFoundError:
+        pass
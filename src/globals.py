@@ -1,4 +1,7 @@
+import itertools
+
 PAGE_ID = None
 SLACK_BOT_TOKEN = None
 BASE_CONFLUENCE_URL = None
-CALLOUT_COUNTER_INDEX = 1
+CALLOUT_COUNTER = itertools.count(1)
+PENDING_ATTACHMENTS = []
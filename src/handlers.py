@@ -1,67 +1,111 @@
-import html
+import re
 from networkUtils import (
-    download_attachment,
     fetch_slack_user_by_email,
     fetch_user_username,
-    upload_to_slack,
+    upload_attachments,
 )
 import globals
 
 from fileUtils import delete_file
 
+_ATTACHMENT_PLACEHOLDER_RE = re.compile(r"\x00attachment-(\d+)\x00")
+_BLOCK_CONTENT_TAGS = frozenset(("ac:structured-macro", "ac:image"))
+
 
 def handle_children(node, processor):
-    return "".join(processor(child) for child in node.children)
+    return "".join([processor(child) for child in node.children])
+
+
+def _macro_parts(node):
+    """Returns a macro's parameters by name and its other child tags by tag name."""
+    # Parameters and bodies are always direct children of the macro, so one pass over
+    # .children replaces a find() search of the whole subtree per lookup. The first
+    # occurrence wins, matching find().
+    parameters = {}
+    parts = {}
+    for child in node.children:
+        name = child.name
+        if name == "ac:parameter":
+            parameters.setdefault(child.get("ac:name"), child)
+        elif name is not None:
+            parts.setdefault(name, child)
+    return parameters, parts
+
+
+def attachment_placeholder(filename):
+    """Queues an attachment for upload and returns a placeholder for its Slack URL."""
+    globals.PENDING_ATTACHMENTS.append(filename)
+    return f"\x00attachment-{len(globals.PENDING_ATTACHMENTS) - 1}\x00"
+
+
+def resolve_attachments(markdown):
+    """Uploads all queued attachments concurrently and swaps their placeholders for Slack URLs."""
+    if not globals.PENDING_ATTACHMENTS:
+        return markdown
+    slack_file_urls = upload_attachments(globals.PENDING_ATTACHMENTS)
+    globals.PENDING_ATTACHMENTS = []
+    return _ATTACHMENT_PLACEHOLDER_RE.sub(
+        lambda match: f"{slack_file_urls[int(match.group(1))]}", markdown
+    )
+
+
+# The handlers below are content formatters: they receive the already-converted Markdown of
+# their children instead of a processor, so the tree walk in process_node can build it
+# iteratively.
 
 
-def handle_p(node, processor):
-    content = handle_children(node, processor)
+def handle_p(node, content):
     # Only treat as empty if content is truly empty (not just whitespace or block-level content)
-    has_block = any(
-        child.name in ("ac:structured-macro", "ac:image")
-        for child in node.descendants
-        if hasattr(child, "name")
-    )
-    if not content.strip() and not has_block:
+    # The descendant walk only runs for paragraphs that rendered blank
+    if not content.strip() and not any(
+        child.name in _BLOCK_CONTENT_TAGS for child in node.descendants
+    ):
         return ""
     # Remove the 'br' check: always output if there is block-level content
     return content + "\n\n"
 
 
 def handle_h(level):
-    def handler(node, processor):
-        content = handle_children(node, processor).strip()
-        return f"{'#' * level} {content}\n\n"
+    prefix = "#" * level
+
+    def handler(node, content):
+        return f"{prefix} {content.strip()}\n\n"
 
     return handler
 
 
-def handle_em(node, processor):
+def _split_edges(content):
+    """Splits text into its leading whitespace, stripped core and trailing whitespace."""
+    # Strip each side once and slice the whitespace off from those results
+    lstripped = content.lstrip()
+    core_text = lstripped.rstrip()
+    return (
+        content[: len(content) - len(lstripped)],
+        core_text,
+        lstripped[len(core_text) :],
+    )
+
+
+def handle_em(node, content):
     """Handles <em> and <i> tags, moving leading/trailing spaces outside the formatting."""
-    content = handle_children(node, processor)
-    leading_whitespace = content[: len(content) - len(content.lstrip())]
-    trailing_whitespace = content[len(content.rstrip()) :]
-    core_text = content.strip()
+    leading_whitespace, core_text, trailing_whitespace = _split_edges(content)
     if not core_text:
         return content  # Return original content if it's all whitespace
     return f"{leading_whitespace}_{core_text}_{trailing_whitespace}"
 
 
-def handle_strong(node, processor):
+def handle_strong(node, content):
     """Handles <strong> and <b> tags, moving leading/trailing spaces outside the formatting."""
-    content = handle_children(node, processor)
-    leading_whitespace = content[: len(content) - len(content.lstrip())]
-    trailing_whitespace = content[len(content.rstrip()) :]
-    core_text = content.strip()
+    leading_whitespace, core_text, trailing_whitespace = _split_edges(content)
     if not core_text:
         return content  # Return original content if it's all whitespace
     # Use single asterisks for Slack's bold format
     return f"{leading_whitespace}**{core_text}**{trailing_whitespace}"
 
 
-def handle_a(node, processor):
+def handle_a(node, content):
     """Handles <a> tags for standard Markdown links."""
-    text = handle_children(node, processor).strip()
+    text = content.strip()
     href = node.get("href", "")
     # Handle Confluence relative links
     if href.startswith("/"):
@@ -72,8 +116,16 @@ def handle_a(node, processor):
     return f"[{text}]({href})" if href else text
 
 
-def handle_li(node, processor):
-    return f"* {handle_children(node, processor).strip()}\n"
+def handle_li(node, content):
+    return f"* {content.strip()}\n"
+
+
+def handle_list(node, content):
+    return content
+
+
+# The handlers below render their own subtree (or ignore it), calling processor on the parts
+# they need.
 
 
 def handle_br(node, processor):
@@ -89,15 +141,16 @@ def handle_confluence_macro(node, processor):
 
 def handle_code_macro(node, processor):
     """Handles Confluence 'code' macros."""
-    body_node = node.find("ac:plain-text-body")
+    parameters, parts = _macro_parts(node)
+    body_node = parts.get("ac:plain-text-body")
     if not body_node:
         return ""
 
-    # After pre-processing, the text is safe to get directly.
-    # We unescape it to restore original characters like '<', '>', '&'.
-    code_content = html.unescape(body_node.get_text(strip=True))
+    # The parser already decodes the entities added in preprocess_code_blocks, so this is
+    # the original CDATA text; unescaping again would decode entities written in the code.
+    code_content = body_node.get_text(strip=True)
 
-    lang_param = node.find("ac:parameter", {"ac:name": "language"})
+    lang_param = parameters.get("language")
     lang = lang_param.get_text(strip=True) if lang_param else ""
 
     if not code_content:
@@ -116,10 +169,7 @@ def handle_image(node, processor):
     if not image_filename:
         return ""
 
-    file_path = download_attachment(image_filename)
-    slack_file_url = upload_to_slack(file_path=file_path)
-
-    return f"![{image_filename}]({slack_file_url})\n\n"
+    return f"![{image_filename}]({attachment_placeholder(image_filename)})\n\n"
 
 
 def handle_multimedia_macro(node, processor):
@@ -132,19 +182,13 @@ def handle_multimedia_macro(node, processor):
     if not multimedia_filename:
         return ""
 
-    file_path = download_attachment(multimedia_filename)
-    slack_file_url = upload_to_slack(file_path=file_path)
-
-    return f"![{multimedia_filename}]({slack_file_url})\n\n"
+    return f"![{multimedia_filename}]({attachment_placeholder(multimedia_filename)})\n\n"
 
 
 def handle_jira_macro(node, processor):
     """Handles Confluence JIRA macros."""
-    jira_issue_key = None
-    for param in node.find_all("ac:parameter"):
-        if param.get("ac:name") == "key":
-            jira_issue_key = param.get_text(strip=True)
-            break
+    key_param = _macro_parts(node)[0].get("key")
+    jira_issue_key = key_param.get_text(strip=True) if key_param else None
     if not jira_issue_key:
         return ""
 
@@ -155,12 +199,12 @@ def handle_jira_macro(node, processor):
 
 def handle_info_note_macro(node, processor):
     """Handles 'info'/'note' macros, wrapping content in callout markers and using standard parsing for inner content. Adds an index to each callout."""
-    title_node = node.find("ac:parameter", {"ac:name": "title"})
+    parameters, parts = _macro_parts(node)
+    title_node = parameters.get("title")
     title = title_node.get_text(strip=True) if title_node else ""
-    body_node = node.find("ac:rich-text-body")
+    body_node = parts.get("ac:rich-text-body")
 
-    current_callout = globals.CALLOUT_COUNTER_INDEX
-    globals.CALLOUT_COUNTER_INDEX += 1
+    current_callout = next(globals.CALLOUT_COUNTER)
 
     output_parts = [f"===========START CALLOUT {current_callout}==========\n"]
     if title:
@@ -180,12 +224,19 @@ def handle_table(node, processor):
     all_rows = []
     th_first_col_every_row = True
 
-    # Find all rows (including those inside <tbody>)
-    for tbody in node.find_all("tbody"):
-        for tr in tbody.find_all("tr", recursive=False):
+    # Find all rows (including those inside <tbody>). Rows and cells are always direct
+    # children, so filter .children by name rather than running a find_all search per level.
+    for tbody in node.children:
+        if tbody.name != "tbody":
+            continue
+        for tr in tbody.children:
+            if tr.name != "tr":
+                continue
             cells = []
             cell_tags = []
-            for cell in tr.find_all(["th", "td"], recursive=False):
+            for cell in tr.children:
+                if cell.name not in ("th", "td"):
+                    continue
                 cell_content = handle_children(cell, processor).strip()
                 cell_content = cell_content.replace("\n", " ").strip()
                 colspan = int(cell.get("colspan", 1))
@@ -213,18 +264,20 @@ def handle_table(node, processor):
         header_cells_fmt = [f"**{header_cells[0]}**"] + header_cells[1:]
     else:
         header_cells_fmt = header_cells
-    output.append("| " + " | ".join(header_cells_fmt) + " |")
-    output.append("|" + "|".join([" --- " for _ in header_cells_fmt]) + "|")
+    ncols = len(header_cells_fmt)
+    join_cells = " | ".join
+    append = output.append
+    append(f"| {join_cells(header_cells_fmt)} |")
+    append("|" + "|".join([" --- "] * ncols) + "|")
 
-    # Render the rest of the rows
+    # Render the rest of the rows, reusing each row's own cell list
     for cells, tags in all_rows[1:]:
         # Pad row if short
-        cells = cells + ["" for _ in range(len(header_cells_fmt) - len(cells))]
+        if len(cells) < ncols:
+            cells.extend([""] * (ncols - len(cells)))
         if th_first_col_every_row:
-            row_fmt = [f"**{cells[0]}**"] + cells[1:]
-        else:
-            row_fmt = cells
-        output.append("| " + " | ".join(row_fmt) + " |")
+            cells[0] = f"**{cells[0]}**"
+        append(f"| {join_cells(cells)} |")
     return "\n".join(output) + "\n\n"
 
 
@@ -252,8 +305,9 @@ def handle_time(node, processor):
 
 
 def handle_task(node, processor):
-    status_node = node.find("ac:task-status")
-    body_node = node.find("ac:task-body")
+    # Status and body are direct children of the task; don't search nested task lists
+    status_node = node.find("ac:task-status", recursive=False)
+    body_node = node.find("ac:task-body", recursive=False)
 
     status = status_node.get_text(strip=True) if status_node else ""
     body = body_node.get_text(strip=True) if body_node else ""
@@ -263,7 +317,7 @@ def handle_task(node, processor):
 
 
 def handle_status_macro(node, processor):
-    title_node = node.find("ac:parameter", {"ac:name": "title"})
+    title_node = _macro_parts(node)[0].get("title")
     title = title_node.get_text(strip=True) if title_node else ""
     return f"**`{title}`**" if title else ""
 
@@ -1,8 +1,17 @@
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import (
+    ConnectionErrorRetryHandler,
+    RateLimitErrorRetryHandler,
+)
+from urllib3.util.retry import Retry
 import globals
 
+from fileUtils import delete_file
 from pathUtils import (
     get_sync_attachment_url,
     get_sync_content_api_url,
@@ -10,6 +19,61 @@ from pathUtils import (
     get_sync_user_api_url,
 )
 
+ATTACHMENT_WORKERS = 8
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# (connect, read) seconds, so a stalled Confluence or Slack host can't hang the run
+REQUEST_TIMEOUT = (3.05, 27)
+# urllib3 applies the first (connect) value to every send() of the request body as well, so
+# streamed attachment uploads need far more headroom than a GET to ride out a stall
+UPLOAD_TIMEOUT = (60, 120)
+# Attachments are mostly already-compressed binaries; asking for them uncompressed keeps
+# the Content-Length exact so they can be streamed, and skips a pointless gunzip
+_ATTACHMENT_HEADERS = {"Accept-Encoding": "identity"}
+
+
+def _pooled_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        # Gateway errors from the load balancer are usually transient. Only idempotent
+        # methods are retried, so the raw-body upload POSTs never are. Once retries run
+        # out, the last response is returned so raise_for_status() reports its status.
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Keep-alive sessions so repeated requests skip the TCP + TLS handshake. Confluence calls
+# share one; uploads go to Slack's file host and get their own pool.
+_SESSION = _pooled_session()
+_UPLOAD_SESSION = _pooled_session()
+_SLACK_CLIENT = None
+
+
+def _slack_client():
+    """Returns the run's shared Slack WebClient, creating it on first use."""
+    # Built lazily because the bot token is only set once main() has read the environment
+    global _SLACK_CLIENT
+    if _SLACK_CLIENT is None:
+        _SLACK_CLIENT = WebClient(
+            token=globals.SLACK_BOT_TOKEN,
+            # Parallel attachment uploads can trip Slack's rate limits; wait out the
+            # Retry-After instead of turning a 429 into a broken image link
+            retry_handlers=[
+                ConnectionErrorRetryHandler(max_retry_count=3),
+                RateLimitErrorRetryHandler(max_retry_count=5),
+            ],
+        )
+    return _SLACK_CLIENT
+
 
 def fetch_confluence_data(cookies):
     storage_url = get_sync_page_storage_url(globals.BASE_CONFLUENCE_URL, globals.PAGE_ID)
@@ -17,15 +81,23 @@ def fetch_confluence_data(cookies):
 
     try:
         print(f"🌐 Fetching page content for page ID: {globals.PAGE_ID}...")
-        # Fetch the main page content (HTML)
-        storage_response = requests.get(storage_url, cookies=cookies)
+        print("📰 Fetching page metadata...")
+        # The main page content (HTML) and the page metadata (JSON for title and author) are
+        # independent, so request both at once instead of waiting on one round trip each
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            storage_future = executor.submit(
+                _SESSION.get, storage_url, cookies=cookies, timeout=REQUEST_TIMEOUT
+            )
+            api_future = executor.submit(
+                _SESSION.get, api_url, cookies=cookies, timeout=REQUEST_TIMEOUT
+            )
+            storage_response = storage_future.result()
+            api_response = api_future.result()
+
         storage_response.raise_for_status()  # Raises an exception for bad status codes (4xx or 5xx)
         html_content = storage_response.text
         print("✅ Content fetched successfully.")
 
-        print("📰 Fetching page metadata...")
-        # Fetch the page metadata (JSON for title and author)
-        api_response = requests.get(api_url, cookies=cookies)
         api_response.raise_for_status()
         metadata = api_response.json()
         print("✅ Metadata fetched successfully.")
@@ -55,12 +127,114 @@ def fetch_confluence_data(cookies):
         return None, None, None
 
 
-def download_attachment(filename):
-    url = get_sync_attachment_url(globals.BASE_CONFLUENCE_URL, globals.PAGE_ID, filename)
+def _spool_to_tmp(filename, response):
+    """Writes a streamed response body to tmp/ and returns the local path, or None on failure."""
     dest_folder = "tmp"
     os.makedirs(dest_folder, exist_ok=True)
     local_path = os.path.join(dest_folder, filename)
 
+    try:
+        # 1 MiB chunks run the Python loop once per MiB rather than once per 8 KiB;
+        # iter_content (unlike reading .raw) still maps read errors to requests exceptions
+        with open(local_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Failed to download '{filename}': {e}")
+        # Don't leave a partial download behind in tmp/
+        delete_file(local_path)
+        return None
+    print(f"🪣 Downloaded '{filename}' to '{local_path}'")
+    return local_path
+
+
+class _SizedStream:
+    """Wraps a readable stream so requests sends it with a Content-Length rather than chunked."""
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=None):
+        return self._stream.read(size)
+
+
+def stream_to_slack(filename, stream, length):
+    """Uploads `length` bytes read from `stream` to Slack and returns the new file's ID."""
+    client = _slack_client()
+    try:
+        uploadUrlResponse = client.files_getUploadURLExternal(
+            filename=filename, length=length
+        )
+        upload_url = uploadUrlResponse["upload_url"]
+        file_id = uploadUrlResponse["file_id"]
+        # The upload URL accepts the raw file bytes as the request body
+        response = _UPLOAD_SESSION.post(
+            upload_url, data=_SizedStream(stream, length), timeout=UPLOAD_TIMEOUT
+        )
+        if response.status_code == 200:
+            print("☁️ File uploaded to Slack successfully.")
+            # The file only gets a permalink once complete_slack_uploads finalizes it
+            return file_id
+        else:
+            print(f"❌ Slack upload failed: {response.status_code} {response.text}")
+            return None
+
+    except Exception as e:
+        print(f"❌ Failed to upload file to Slack: {e}")
+        return None
+
+
+def complete_slack_uploads(uploads):
+    """Finalizes (file ID, title) uploads, in one call when possible; returns permalinks by ID."""
+    if not uploads:
+        return {}
+    client = _slack_client()
+    try:
+        response = client.files_completeUploadExternal(
+            files=[{"id": file_id, "title": title} for file_id, title in uploads]
+        )
+        return {file["id"]: file["permalink"] for file in response["files"]}
+    except Exception as e:
+        if len(uploads) == 1:
+            print(f"❌ Failed to complete Slack upload: {e}")
+            return {}
+        print(
+            f"⚠️ Batched Slack upload completion failed, completing files one by one: {e}"
+        )
+
+    # One bad file ID fails the whole batch; finish the rest individually so it only
+    # costs its own image
+    permalinks = {}
+    for file_id, title in uploads:
+        try:
+            response = client.files_completeUploadExternal(
+                files=[{"id": file_id, "title": title}]
+            )
+            permalinks[file_id] = response["files"][0]["permalink"]
+        except Exception as e:
+            print(f"❌ Failed to complete Slack upload for '{title}': {e}")
+    return permalinks
+
+
+def upload_to_slack(file_path):
+    try:
+        with open(file_path, "rb") as f:
+            return stream_to_slack(
+                os.path.basename(file_path), f, os.path.getsize(file_path)
+            )
+    except OSError as e:
+        print(f"❌ Failed to upload file to Slack: {e}")
+        return None
+
+
+def upload_attachment(filename):
+    """Pipes an attachment from Confluence straight into a Slack upload, returning its file ID."""
+    url = get_sync_attachment_url(globals.BASE_CONFLUENCE_URL, globals.PAGE_ID, filename)
+
     aws_cookie = os.getenv("AWSELB_COOKIE")
     jsessionid = os.getenv("JSESSIONID")
     if not all([aws_cookie, jsessionid]):
@@ -73,47 +247,55 @@ def download_attachment(filename):
     }
 
     try:
-        response = requests.get(url, cookies=cookies, stream=True)
-        response.raise_for_status()
-        with open(local_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        print(f"🪣 Downloaded '{filename}' to '{local_path}'")
-        return local_path  # Always return the local file path on success
+        with _SESSION.get(
+            url,
+            cookies=cookies,
+            headers=_ATTACHMENT_HEADERS,
+            stream=True,
+            timeout=REQUEST_TIMEOUT,
+        ) as response:
+            response.raise_for_status()
+            content_length = response.headers.get("Content-Length")
+            # Slack needs the exact byte count up front, which a compressed body doesn't give us
+            if content_length and not response.headers.get("Content-Encoding"):
+                print(f"🪣 Streaming '{filename}' from Confluence to Slack")
+                return stream_to_slack(filename, response.raw, int(content_length))
+            # Size unknown until the body is read: spool this same response to disk first
+            file_path = _spool_to_tmp(filename, response)
     except requests.exceptions.RequestException as e:
         print(f"❌ Failed to download '{filename}': {e}")
         return None
 
-
-def upload_to_slack(file_path):
-    client = WebClient(token=globals.SLACK_BOT_TOKEN)
+    if file_path is None:
+        return None
     try:
-        uploadUrlResponse = client.files_getUploadURLExternal(
-            filename=os.path.basename(file_path), length=os.path.getsize(file_path)
-        )
-        upload_url = uploadUrlResponse["upload_url"]
-        file_id = uploadUrlResponse["file_id"]
-        with open(file_path, "rb") as f:
-            files = {"file": (os.path.basename(file_path), f)}
-            response = requests.post(upload_url, files=files)
-            if response.status_code == 200:
-                print("☁️ File uploaded to Slack successfully.")
-                complete_response = client.files_completeUploadExternal(
-                    files=[{"id": file_id, "title": os.path.basename(file_path)}]
-                )
-                return complete_response["files"][0]["permalink"]
-            else:
-                print(f"❌ Slack upload failed: {response.status_code} {response.text}")
-                return None
+        return upload_to_slack(file_path=file_path)
+    finally:
+        delete_file(file_path)
 
-    except Exception as e:
-        print(f"❌ Failed to upload file to Slack: {e}")
-        return None
+
+def upload_attachments(filenames):
+    """Downloads and uploads attachments concurrently, returning Slack URLs in the same order."""
+    # Each file is fetched once; concurrent downloads of the same name would share a tmp path
+    unique_filenames = list(dict.fromkeys(filenames))
+    with ThreadPoolExecutor(max_workers=ATTACHMENT_WORKERS) as executor:
+        file_ids = list(executor.map(upload_attachment, unique_filenames))
+
+    # Finalize every upload with one Slack call instead of one per file
+    uploads = [
+        (file_id, filename)
+        for filename, file_id in zip(unique_filenames, file_ids)
+        if file_id is not None
+    ]
+    permalinks = complete_slack_uploads(uploads)
+    slack_file_urls = {
+        filename: permalinks.get(file_id) for file_id, filename in uploads
+    }
+    return [slack_file_urls.get(filename) for filename in filenames]
 
 
 def create_slack_canvas(channel_id, title, markdown_content):
-    client = WebClient(token=globals.SLACK_BOT_TOKEN)
+    client = _slack_client()
     try:
         response = client.canvases_create(
             title=title,
@@ -129,7 +311,16 @@ def create_slack_canvas(channel_id, title, markdown_content):
         return None
 
 
+# Pages mention the same people repeatedly, so successful lookups are kept for the run.
+# Failures (None) aren't stored: a transient error shouldn't blank every later mention.
+# The exception is Slack's users_not_found, a definite answer worth remembering.
+_USERNAME_CACHE = {}
+_SLACK_USER_ID_CACHE = {}
+
+
 def fetch_user_username(userkey):
+    if userkey in _USERNAME_CACHE:
+        return _USERNAME_CACHE[userkey]
     user_api_url = get_sync_user_api_url(globals.BASE_CONFLUENCE_URL, userkey)
     aws_cookie = os.getenv("AWSELB_COOKIE")
     jsessionid = os.getenv("JSESSIONID")
@@ -143,24 +334,34 @@ def fetch_user_username(userkey):
     }
 
     try:
-        response = requests.get(user_api_url, cookies=cookies)
+        response = _SESSION.get(user_api_url, cookies=cookies, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
         user_data = response.json()
-        return user_data.get("username", "Unknown User")
+        username = user_data.get("username", "Unknown User")
+        _USERNAME_CACHE[userkey] = username
+        return username
     except requests.exceptions.RequestException as e:
         print(f"❌ Failed to fetch user data: {e}")
         return None
 
 
 def fetch_slack_user_by_email(email):
-    client = WebClient(token=globals.SLACK_BOT_TOKEN)
+    if email in _SLACK_USER_ID_CACHE:
+        return _SLACK_USER_ID_CACHE[email]
+    client = _slack_client()
     try:
         response = client.users_lookupByEmail(email=email)
         if response["ok"]:
             print(f"🔍 Slack user found for {email} ({response['user']['id']})")
+            _SLACK_USER_ID_CACHE[email] = response["user"]["id"]
             return response["user"]["id"]
         else:
             print(f"🤷 Slack user not found for {email}.")
             return None
+    except SlackApiError as e:
+        if e.response["error"] == "users_not_found":
+            print(f"🤷 Slack user not found for {email}.")
+            _SLACK_USER_ID_CACHE[email] = None
+        return None
     except Exception as e:
         return None
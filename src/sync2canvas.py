@@ -19,38 +19,47 @@ from handlers import (
     handle_a,
     handle_ac_link,
     handle_br,
-    handle_children,
     handle_confluence_macro,
     handle_em,
     handle_h,
     handle_image,
     handle_li,
+    handle_list,
     handle_p,
     handle_ri_user,
     handle_strong,
     handle_table,
     handle_task,
     handle_time,
+    resolve_attachments,
 )
 
-TAG_MAPPINGS = {
+# Headings below h3 are flattened to h3, sharing one handler
+_handle_h3 = handle_h(3)
+
+# Tags whose handler formats the already-converted Markdown of their children.
+CONTENT_MAPPINGS = {
     "p": handle_p,
     "h1": handle_h(1),
     "h2": handle_h(2),
-    "h3": handle_h(3),
-    "h4": handle_h(3),
-    "h5": handle_h(3),
-    "h6": handle_h(3),
+    "h3": _handle_h3,
+    "h4": _handle_h3,
+    "h5": _handle_h3,
+    "h6": _handle_h3,
     "li": handle_li,
-    "ul": handle_children,
-    "ol": handle_children,
-    "br": handle_br,
+    "ul": handle_list,
+    "ol": handle_list,
     "a": handle_a,
     "em": handle_em,
     "i": handle_em,
     "u": handle_strong,
     "strong": handle_strong,
     "b": handle_strong,
+}
+
+# Tags whose handler renders its own subtree, calling back into process_node where needed.
+TAG_MAPPINGS = {
+    "br": handle_br,
     "ac:image": handle_image,
     "table": handle_table,
     "ac:structured-macro": handle_confluence_macro,
@@ -60,22 +69,9 @@ TAG_MAPPINGS = {
     "ac:task": handle_task,
 }
 
-
-def process_node(node):
-    """
-    Recursively processes a BeautifulSoup node and its children,
-    converting them to Markdown based on defined mappings.
-    """
-    if isinstance(node, NavigableString):
-        if isinstance(node, CData):
-            return node
-        text = str(node).replace("\xa0", " ")
-        return re.sub(r"\s+", " ", text)
-    if node.name in TAG_MAPPINGS:
-        result = TAG_MAPPINGS[node.name](node, process_node)
-        return result
-    # Block-level tags that should be separated by blank lines
-    block_tags = {
+# Block-level tags that should be separated by blank lines
+_BLOCK_TAGS = frozenset(
+    {
         "p",
         "h1",
         "h2",
@@ -92,14 +88,67 @@ def process_node(node):
         "footer",
         "blockquote",
     }
-    if hasattr(node, "children"):
-        children = list(node.children)
-        # If any child is block-level, join with two newlines
-        if any(getattr(child, "name", None) in block_tags for child in children):
-            return "\n\n".join(process_node(child) for child in children)
+)
+
+_COLLAPSE_BLANKS = re.compile(r"\n{3,}")
+_WS_RE = re.compile(r"\s+")
+_ws_sub = _WS_RE.sub
+# Finds a plain-text-body tag containing a CDATA section and captures the CDATA content.
+# It handles multiline content with re.DOTALL.
+_CDATA_BODY_RE = re.compile(
+    r"<ac:plain-text-body>.*?<!\[CDATA\[(.*?)\]\]>.*?</ac:plain-text-body>",
+    re.DOTALL,
+)
+
+
+def process_node(node):
+    """
+    Processes a BeautifulSoup node and its children, converting them to Markdown
+    based on defined mappings.
+
+    The tree is walked with an explicit stack rather than by recursion: each entry is a
+    (node, children_done) pair, and the converted children of every open tag are
+    collected in a parallel stack of string lists until the tag itself is formatted.
+    """
+    results = [[]]
+    stack = [(node, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            parts = results.pop()
+            formatter = CONTENT_MAPPINGS.get(node.name)
+            if formatter is not None:
+                results[-1].append(formatter(node, "".join(parts)))
+                continue
+            # If any child is block-level, join with two newlines
+            separator = ""
+            for child in node.children:
+                if child.name in _BLOCK_TAGS:
+                    separator = "\n\n"
+                    break
+            results[-1].append(separator.join(parts))
+            continue
+        if isinstance(node, NavigableString):
+            if isinstance(node, CData):
+                results[-1].append(node)
+            else:
+                text = str(node)
+                # \s also matches non-breaking spaces, so this normalizes them too. Every
+                # whitespace character other than " " is non-printable, so printable text
+                # without a double space has nothing to collapse and can skip the regex.
+                # Indentation between tags is whitespace only and collapses to one space.
+                if not text.isprintable() or "  " in text:
+                    text = " " if text.isspace() else _ws_sub(" ", text)
+                results[-1].append(text)
+            continue
+        handler = TAG_MAPPINGS.get(node.name)
+        if handler is not None:
+            results[-1].append(handler(node, process_node))
         else:
-            return "".join(process_node(child) for child in children)
-    return ""
+            results.append([])
+            stack.append((node, True))
+            stack.extend([(child, False) for child in reversed(node.contents)])
+    return "".join(results[0])
 
 
 callout_counter = 0
@@ -120,14 +169,13 @@ def preprocess_code_blocks(html_content):
         # Return the plain-text-body tag with the encoded content
         return f"<ac:plain-text-body>{encoded_content}</ac:plain-text-body>"
 
-    # This regex finds a plain-text-body tag containing a CDATA section and captures the CDATA content.
-    # It handles multiline content with re.DOTALL.
-    pattern = re.compile(
-        r"<ac:plain-text-body>.*?<!\[CDATA\[(.*?)\]\]>.*?</ac:plain-text-body>",
-        re.DOTALL,
-    )
+    # lxml's HTML parser turns CDATA into comments, so this has to happen before parsing.
+    # Most pages have no code blocks at all; skip the regex scan entirely for those. A match
+    # needs both markers, so a page missing either one is left alone.
+    if "<![CDATA[" not in html_content or "<ac:plain-text-body>" not in html_content:
+        return html_content
 
-    return pattern.sub(replacer, html_content)
+    return _CDATA_BODY_RE.sub(replacer, html_content)
 
 
 def convert_confluence_html_to_markdown(html_content):
@@ -148,7 +196,9 @@ def convert_confluence_html_to_markdown(html_content):
 
     # Process the entire body of the parsed document, or the soup itself if no body tag.
     markdown_output = process_node(soup.body or soup)
-    return re.sub(r"\n{3,}", "\n\n", markdown_output).strip()
+    # Attachments were queued during the walk; upload them together now.
+    markdown_output = resolve_attachments(markdown_output)
+    return _COLLAPSE_BLANKS.sub("\n\n", markdown_output).strip()
 
 
 # --- Main Execution ---
@@ -167,6 +217,11 @@ def main():
         default="https://sync.hudlnet.com",
         help="The base URL for the Confluence instance (default: https://sync.hudlnet.com)."
     )
+    parser.add_argument(
+        "--no-format",
+        action="store_true",
+        help="Skip the mdformat pass over the converted Markdown (faster on large pages).",
+    )
     args = parser.parse_args()
 
     # Save the page id and base URL globally
@@ -209,7 +264,11 @@ def main():
         f"_Original Author: ![](@{user_slack_id})_\n\n{body_markdown}"
     )
 
-    formatted_markdown_for_payload = mdformat.text(markdown_for_payload)
+    # mdformat re-parses and re-renders the whole document, the slowest step on big pages
+    if args.no_format:
+        formatted_markdown_for_payload = markdown_for_payload
+    else:
+        formatted_markdown_for_payload = mdformat.text(markdown_for_payload)
     markdown_for_file = f"# {title}\n\n{formatted_markdown_for_payload}"
 
     # Create Output Directory and Filenames
@@ -220,23 +279,24 @@ def main():
     md_output_path = os.path.join(output_dir, f"{base_filename}.md")
     json_output_path = os.path.join(output_dir, f"{base_filename}_payload.json")
 
-    # Write the JSON payload to a separate file
-    with open(json_output_path, "w", encoding="utf-8") as f:
-        json.dump(
-            {
-                "title": title,
-                "markdown": formatted_markdown_for_payload,
-                "author_slack_id": user_slack_id,
-            },
-            f,
-            ensure_ascii=False,
-            indent=2,
-        )
+    # Write the JSON payload to a separate file. Serializing and encoding up front means one
+    # write call instead of one per token that json.dump would stream out.
+    payload_json = json.dumps(
+        {
+            "title": title,
+            "markdown": formatted_markdown_for_payload,
+            "author_slack_id": user_slack_id,
+        },
+        ensure_ascii=False,
+        indent=2,
+    ).encode("utf-8")
+    with open(json_output_path, "wb") as f:
+        f.write(payload_json)
     print(f"✔️ JSON payload saved to: '{json_output_path}'")
 
     # Write the Markdown File (with the title)
-    with open(md_output_path, "w", encoding="utf-8") as f:
-        f.write(markdown_for_file)
+    with open(md_output_path, "wb") as f:
+        f.write(markdown_for_file.encode("utf-8"))
     print(f"✔️ Markdown file saved to: '{md_output_path}'")
 
     create_slack_canvas(